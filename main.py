@@ -1,12 +1,18 @@
+import base64
+import json
+import logging
 import os
-from uuid import UUID
-from typing import Optional
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import Annotated, Optional
 from fastapi.middleware.cors import CORSMiddleware
 
+import httpx
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel
-from supabase import create_client, Client
+from pydantic import AfterValidator, BaseModel, ConfigDict, StringConstraints, TypeAdapter, ValidationError
+from supabase import acreate_client, AsyncClientOptions
 
 # -------------------------
 # ENV & SUPABASE
@@ -19,12 +25,45 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("SUPABASE_URL veya SUPABASE_KEY .env içinde bulunamadı!")
 
-# ⚠️ Güvenlik: prod'da key print etme (istersen debug için aç)
-# print("KEY:", SUPABASE_KEY[:30])
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tek bir pooled HTTP client: PostgREST + GoTrue çağrıları keep-alive bağlantıları
+    # yeniden kullanır, her istekte TCP/TLS handshake ödenmez. HTTP/2 ile eşzamanlı
+    # istekler tek bağlantıda multiplex edilir.
+    # (transport verildiğinde limits/http2 client'ta değil transport'ta olmalı)
+    http_client = httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30),
+            retries=1,
+        ),
+        headers={"Accept-Encoding": "gzip"},
+        timeout=httpx.Timeout(10.0, connect=2.0),
+        follow_redirects=True,
+    )
+    app.state.supabase = await acreate_client(
+        SUPABASE_URL,
+        SUPABASE_KEY,
+        options=AsyncClientOptions(httpx_client=http_client),
+    )
+
+    # Preflight: bağlantı havuzunu ve PostgREST schema cache'ini ilk kullanıcı
+    # isteğinden önce ısıt. Başarısız olursa uygulama yine de ayağa kalkar.
+    try:
+        await app.state.supabase.table("products").select("id").limit(1).execute()
+    except Exception as e:
+        logger.warning("Supabase preflight başarısız: %s", e)
+
+    try:
+        yield
+    finally:
+        await http_client.aclose()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-app = FastAPI(title="Vetcent API", version="0.1.0")
+app = FastAPI(title="Vetcent API", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],  # şimdilik sadece local frontend
@@ -33,9 +72,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -------------------------
+# SELECT'LER (PostgREST kolon listeleri, modül seviyesinde bir kez)
+# -------------------------
+PRODUCTS_SELECT = "id,name,description,unit,brand,categories(id,name)"
+OFFERS_SELECT = "id,price,stock,delivery_days,supplier_id"
+BEST_OFFER_SELECT = "id,price,stock,delivery_days,supplier_id,suppliers(id,name)"
+CART_SELECT = (
+    "id,total_amount,"
+    "order_items(id,quantity,unit_price,supplier_id,product_id,products(id,name),suppliers(id,name))"
+)
+SUPPLIER_PRICES_SELECT = (
+    "id,price,stock,delivery_days,is_active,version,created_at,product_id,supplier_id,"
+    "products(id,name,unit,brand)"
+)
+
 # -------------------------
 # MODELLER
 # -------------------------
+# UUID'ler PostgREST'e zaten string gidiyor: pydantic-core formatı doğrular,
+# UUID() parse + str() geri dönüşümü yapılmaz. Küçük harfe normalize edilir ki
+# response'larda dönen id'ler DB anahtarlarıyla aynı olsun.
+UUID_PATTERN = r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+UUIDStr = Annotated[str, StringConstraints(pattern=UUID_PATTERN), AfterValidator(str.lower)]
+_uuid_str = TypeAdapter(UUIDStr)
+_uuid_list = TypeAdapter(list[UUIDStr])
+
+
 class SignupRequest(BaseModel):
     email: str
     password: str
@@ -48,8 +111,8 @@ class LoginRequest(BaseModel):
 
 
 class SupplierPriceCreate(BaseModel):
-    supplier_id: UUID
-    product_id: UUID
+    supplier_id: UUIDStr
+    product_id: UUIDStr
     price: float
     stock: int = 0
     delivery_days: int = 1
@@ -61,68 +124,226 @@ class SupplierPriceUpdate(BaseModel):
     stock: Optional[int] = None
     delivery_days: Optional[int] = None
     is_active: Optional[bool] = None
+    version: int  # istemcinin okuduğu supplier_prices.version (optimistic lock)
 
 
 class CartAddItem(BaseModel):
-    clinic_user_id: UUID
-    product_id: UUID
-    supplier_id: UUID
+    clinic_user_id: UUIDStr
+    product_id: UUIDStr
+    supplier_id: UUIDStr
     quantity: int = 1
 
 
 class OrderCreateRequest(BaseModel):
-    clinic_user_id: UUID
+    clinic_user_id: UUIDStr
+
+
+# -------------------------
+# RESPONSE MODELLERİ (response_model: pydantic-core doğrudan JSON bytes'a serialize eder)
+# -------------------------
+class OutModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CategoryOut(OutModel):
+    id: str
+    name: Optional[str] = None
+
+
+class ProductOut(OutModel):
+    id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    unit: Optional[str] = None
+    brand: Optional[str] = None
+    categories: Optional[CategoryOut] = None
+
+
+class ProductSearchOut(OutModel):
+    q: Optional[str] = None
+    category_id: Optional[str] = None
+    brand: Optional[str] = None
+    unit: Optional[str] = None
+    limit: int
+    cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    items: list[ProductOut]
+
+
+class SupplierRefOut(OutModel):
+    id: str
+    name: Optional[str] = None
+
+
+class OfferOut(OutModel):
+    id: str
+    price: float
+    stock: Optional[int] = None
+    delivery_days: Optional[int] = None
+    supplier_id: str
+
+
+class BestOfferOut(OfferOut):
+    suppliers: Optional[SupplierRefOut] = None
+
+
+class BulkBestOfferOut(BestOfferOut):
+    product_id: str
+
+
+class ProductOffersOut(OutModel):
+    product_id: str
+    offers: list[OfferOut]
+
+
+class ProductBestOfferOut(OutModel):
+    product_id: str
+    best_offer: Optional[BestOfferOut] = None
+
+
+class BulkBestOffersOut(OutModel):
+    product_ids: list[str]
+    best_offers: dict[str, Optional[BulkBestOfferOut]]
+
+
+class ProductRefOut(OutModel):
+    id: str
+    name: Optional[str] = None
+
+
+class CartItemOut(OutModel):
+    id: str
+    quantity: int
+    unit_price: float
+    supplier_id: str
+    product_id: str
+    products: Optional[ProductRefOut] = None
+    suppliers: Optional[SupplierRefOut] = None
+
+
+class CartOut(OutModel):
+    order_id: Optional[str] = None
+    items: list[CartItemOut]
+    total_amount: float
+
+
+class OrderOut(OutModel):
+    id: str
+    status: str
+    total_amount: Optional[float] = None
+    created_at: Optional[str] = None
+
+
+class ClinicOrdersOut(OutModel):
+    clinic_user_id: str
+    orders: list[OrderOut]
+
+
+class SupplierProductOut(OutModel):
+    id: str
+    name: Optional[str] = None
+    unit: Optional[str] = None
+    brand: Optional[str] = None
+
+
+class SupplierPriceOut(OutModel):
+    id: str
+    price: float
+    stock: Optional[int] = None
+    delivery_days: Optional[int] = None
+    is_active: bool
+    version: int
+    created_at: Optional[str] = None
+    product_id: str
+    supplier_id: str
+    products: Optional[SupplierProductOut] = None
+
+
+class SupplierPricesOut(OutModel):
+    supplier_id: str
+    items: list[SupplierPriceOut]
 
 
 # -------------------------
 # HELPERS
 # -------------------------
-def _recalc_and_update_order_total(order_id: str) -> float:
-    items_res = (
-        supabase
-        .table("order_items")
-        .select("quantity, unit_price")
-        .eq("order_id", order_id)
-        .execute()
-    )
-    items = items_res.data or []
-    total = sum((i.get("quantity") or 0) * (i.get("unit_price") or 0) for i in items)
+# Neredeyse statik referans verisi (kategori, marka, birim, ürün listesi) için
+# process içi cache; TTL dolunca bir sonraki istek DB'den tazeler.
+_reference_cache: TTLCache = TTLCache(maxsize=32, ttl=60)
+
+
+def _ttl_cached(key: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = (key, *args, *sorted(kwargs.items()))
+            try:
+                return _reference_cache[cache_key]
+            except KeyError:
+                pass
+            value = await func(*args, **kwargs)
+            _reference_cache[cache_key] = value
+            return value
+        return wrapper
+    return decorator
+
+
+# GoTrue'dan az önce aldığımız token'ın payload'ı (imza doğrulaması gerekmiyor)
+def _jwt_claims(token: Optional[str]) -> dict:
+    if not token:
+        return {}
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except Exception:
+        return {}
+
+
+# /products/search keyset cursor'ı: son satırın (name, id) çifti, opak base64 string
+def _encode_search_cursor(row: dict) -> str:
+    raw = json.dumps([row["name"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
 
-    supabase.table("orders").update({"total_amount": total}).eq("id", order_id).execute()
-    return total
+def _decode_search_cursor(cursor: str) -> tuple[Optional[str], str]:
+    try:
+        name, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        row_id = _uuid_str.validate_python(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Geçersiz cursor")
+    if not (name is None or isinstance(name, str)):
+        raise HTTPException(status_code=400, detail="Geçersiz cursor")
+    return name, row_id
+
+
+def _postgrest_quote(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
 
 
 # -------------------------
 # ROUTES
 # -------------------------
 @app.get("/")
-def root():
+async def root():
     return {"message": "Vetcent backend çalışıyor!"}
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
 # --- 23) PRODUCTS (master list)
-@app.get("/products")
-def get_products():
+@app.get("/products", response_model=list[ProductOut])
+@_ttl_cached("products")
+async def get_products():
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("products")
-            .select("""
-                id,
-                name,
-                description,
-                unit,
-                brand,
-                categories (
-                    id,
-                    name
-                )
-            """)
+            .select(PRODUCTS_SELECT)
             .execute()
         )
         return res.data
@@ -131,38 +352,31 @@ def get_products():
 
 
 # --- 26) SEARCH
-@app.get("/products/search")
-def search_products(
+@app.get("/products/search", response_model=ProductSearchOut)
+async def search_products(
     q: Optional[str] = None,
-    category_id: Optional[UUID] = None,
+    category_id: Optional[UUIDStr] = None,
     brand: Optional[str] = None,
     unit: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
 ):
+    after = _decode_search_cursor(cursor) if cursor else None
+
     try:
         query = (
-            supabase
+            app.state.supabase
             .table("products")
-            .select("""
-                id,
-                name,
-                description,
-                unit,
-                brand,
-                categories (
-                    id,
-                    name
-                )
-            """)
+            .select(PRODUCTS_SELECT, count="exact" if include_total else None)
         )
 
         if q and q.strip():
-            pattern = f"%{q.strip()}%"
-            query = query.or_(f"name.ilike.{pattern},brand.ilike.{pattern},description.ilike.{pattern}")
+            # text_search() filtre/order metodu olmayan bir builder döner; filter() zinciri korur
+            query = query.filter("search_tsv", "wfts(simple)", q.strip())
 
         if category_id:
-            query = query.eq("category_id", str(category_id))
+            query = query.eq("category_id", category_id)
 
         if brand and brand.strip():
             query = query.ilike("brand", f"%{brand.strip()}%")
@@ -170,17 +384,30 @@ def search_products(
         if unit and unit.strip():
             query = query.ilike("unit", f"%{unit.strip()}%")
 
-        query = query.order("name").range(offset, offset + limit - 1)
-        res = query.execute()
+        # keyset: (name, id) > cursor -> OFFSET taraması yok, derin sayfalar da index seek.
+        # name ASC'de NULL'lar en sonda: null-name segmenti ayrıca taranır.
+        if after:
+            name, row_id = after
+            if name is None:
+                query = query.is_("name", "null").gt("id", row_id)
+            else:
+                quoted = _postgrest_quote(name)
+                query = query.or_(f"name.gt.{quoted},and(name.eq.{quoted},id.gt.{row_id}),name.is.null")
+
+        query = query.order("name").order("id").limit(limit)
+        res = await query.execute()
+        items = res.data or []
 
         return {
             "q": q,
-            "category_id": str(category_id) if category_id else None,
+            "category_id": category_id,
             "brand": brand,
             "unit": unit,
             "limit": limit,
-            "offset": offset,
-            "items": res.data
+            "cursor": cursor,
+            "next_cursor": _encode_search_cursor(items[-1]) if len(items) == limit else None,
+            "total": res.count if include_total else None,
+            "items": items
         }
 
     except Exception as e:
@@ -188,11 +415,12 @@ def search_products(
 
 
 # --- 25) CATEGORIES
-@app.get("/categories")
-def get_categories():
+@app.get("/categories", response_model=list[CategoryOut])
+@_ttl_cached("categories")
+async def get_categories():
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("categories")
             .select("id, name")
             .order("name")
@@ -204,43 +432,41 @@ def get_categories():
 
 
 # (Opsiyonel helper)
-@app.get("/brands")
-def get_brands():
+@app.get("/brands", response_model=list[str])
+@_ttl_cached("brands")
+async def get_brands():
     try:
-        res = (
-            supabase
-            .table("products")
+        res = await (
+            app.state.supabase
+            .table("product_brands")
             .select("brand")
-            .neq("brand", None)
-            .neq("brand", "")
+            .order("brand")
             .execute()
         )
-        brands = sorted({row["brand"] for row in res.data if row.get("brand")})
-        return brands
+        return [row["brand"] for row in res.data]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/units")
-def get_units():
+@app.get("/units", response_model=list[str])
+@_ttl_cached("units")
+async def get_units():
     try:
-        res = (
-            supabase
-            .table("products")
+        res = await (
+            app.state.supabase
+            .table("product_units")
             .select("unit")
-            .neq("unit", None)
-            .neq("unit", "")
+            .order("unit")
             .execute()
         )
-        units = sorted({row["unit"] for row in res.data if row.get("unit")})
-        return units
+        return [row["unit"] for row in res.data]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # --- 21) SIGNUP (✅ FIX: profiles insert YOK, role metadata VAR)
 @app.post("/signup")
-def signup(payload: SignupRequest):
+async def signup(payload: SignupRequest):
     email = payload.email.strip().lower()
     role = payload.role.strip().lower()
 
@@ -248,7 +474,7 @@ def signup(payload: SignupRequest):
         raise HTTPException(status_code=400, detail="role sadece 'clinic' veya 'supplier' olabilir")
 
     try:
-        auth_res = supabase.auth.sign_up({
+        auth_res = await app.state.supabase.auth.sign_up({
             "email": email,
             "password": payload.password,
             "options": {
@@ -276,11 +502,11 @@ def signup(payload: SignupRequest):
 
 # --- 22) LOGIN
 @app.post("/login")
-def login(payload: LoginRequest):
+async def login(payload: LoginRequest):
     email = payload.email.strip().lower()
 
     try:
-        auth_res = supabase.auth.sign_in_with_password({"email": email, "password": payload.password})
+        auth_res = await app.state.supabase.auth.sign_in_with_password({"email": email, "password": payload.password})
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Giriş başarısız: {str(e)}")
 
@@ -291,19 +517,26 @@ def login(payload: LoginRequest):
         raise HTTPException(status_code=401, detail="Giriş başarısız: kullanıcı bulunamadı")
 
     user_id = user.id
+    access_token = session.access_token if session else None
 
-    try:
-        prof = (
-            supabase
-            .table("profiles")
-            .select("role")
-            .eq("user_id", user_id)
-            .single()
-            .execute()
-        )
-        role = prof.data.get("role") if prof.data else None
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Role çekme hatası: {str(e)}")
+    # custom_access_token_hook rolü token'a gömer; claim yoksa profiles'a düş.
+    # (user_metadata kullanıcı tarafından değiştirilebilir, rol için güvenilmez.)
+    role = _jwt_claims(access_token).get("user_role")
+
+    if not role:
+        try:
+            prof = await (
+                app.state.supabase
+                .table("profiles")
+                .select("role")
+                .eq("user_id", user_id)
+                .maybe_single()
+                .execute()
+            )
+            # profil yoksa maybe_single() None döner (406 exception'ı yok)
+            role = prof.data.get("role") if prof is not None and prof.data else None
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Role çekme hatası: {str(e)}")
 
     if not role:
         raise HTTPException(status_code=404, detail="Bu kullanıcı için profiles.role bulunamadı")
@@ -312,49 +545,67 @@ def login(payload: LoginRequest):
         "message": "Giriş başarılı",
         "user_id": user_id,
         "role": role,
-        "access_token": session.access_token if session else None
+        "access_token": access_token
     }
 
 
+# --- 30) BULK BEST OFFERS (liste sayfası: N ayrı best-offer çağrısı yerine tek istek)
+@app.get("/products/offers", response_model=BulkBestOffersOut)
+async def get_best_offers_bulk(ids: str = Query(..., description="Virgülle ayrılmış product id listesi")):
+    try:
+        product_ids = list(dict.fromkeys(_uuid_list.validate_python([i.strip() for i in ids.split(",") if i.strip()])))
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="ids geçerli UUID listesi olmalı")
+
+    if not product_ids:
+        raise HTTPException(status_code=400, detail="ids boş olamaz")
+    if len(product_ids) > 100:
+        raise HTTPException(status_code=400, detail="ids en fazla 100 ürün içerebilir")
+
+    try:
+        res = await (
+            app.state.supabase
+            .rpc("best_offers_bulk", {"p_ids": product_ids})
+            .execute()
+        )
+        best_by_product = {row["product_id"]: row for row in res.data or []}
+        return {
+            "product_ids": product_ids,
+            "best_offers": {pid: best_by_product.get(pid) for pid in product_ids}
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # --- 24) PRODUCT OFFERS (supplier_prices)
-@app.get("/products/{product_id}/offers")
-def get_product_offers(product_id: UUID):
+@app.get("/products/{product_id}/offers", response_model=ProductOffersOut)
+async def get_product_offers(product_id: UUIDStr):
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("supplier_prices")
-            .select("id, price, stock, delivery_days, supplier_id")
-            .eq("product_id", str(product_id))
+            .select(OFFERS_SELECT)
+            .eq("product_id", product_id)
             .eq("is_active", True)
             .gt("stock", 0)
             .order("price")
             .order("delivery_days")
             .execute()
         )
-        return {"product_id": str(product_id), "offers": res.data}
+        return {"product_id": product_id, "offers": res.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # --- 27) PRODUCT BEST OFFER
-@app.get("/products/{product_id}/best-offer")
-def get_product_best_offer(product_id: UUID):
+@app.get("/products/{product_id}/best-offer", response_model=ProductBestOfferOut)
+async def get_product_best_offer(product_id: UUIDStr):
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("supplier_prices")
-            .select("""
-                id,
-                price,
-                stock,
-                delivery_days,
-                supplier_id,
-                suppliers (
-                    id,
-                    name
-                )
-            """)
-            .eq("product_id", str(product_id))
+            .select(BEST_OFFER_SELECT)
+            .eq("product_id", product_id)
             .eq("is_active", True)
             .gt("stock", 0)
             .order("price")
@@ -363,14 +614,14 @@ def get_product_best_offer(product_id: UUID):
             .execute()
         )
         best = res.data[0] if res.data else None
-        return {"product_id": str(product_id), "best_offer": best}
+        return {"product_id": product_id, "best_offer": best}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # --- 28) SUPPLIER PRICE CRUD
 @app.post("/supplier/prices")
-def create_supplier_price(payload: SupplierPriceCreate):
+async def create_supplier_price(payload: SupplierPriceCreate):
     if payload.price <= 0:
         raise HTTPException(status_code=400, detail="price > 0 olmalı")
     if payload.stock < 0:
@@ -379,12 +630,12 @@ def create_supplier_price(payload: SupplierPriceCreate):
         raise HTTPException(status_code=400, detail="delivery_days > 0 olmalı")
 
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("supplier_prices")
             .insert({
-                "supplier_id": str(payload.supplier_id),
-                "product_id": str(payload.product_id),
+                "supplier_id": payload.supplier_id,
+                "product_id": payload.product_id,
                 "price": payload.price,
                 "stock": payload.stock,
                 "delivery_days": payload.delivery_days,
@@ -398,21 +649,39 @@ def create_supplier_price(payload: SupplierPriceCreate):
 
 
 @app.put("/supplier/prices/{price_id}")
-def update_supplier_price(price_id: UUID, payload: SupplierPriceUpdate):
-    updates = {k: v for k, v in payload.dict().items() if v is not None}
+async def update_supplier_price(price_id: UUIDStr, payload: SupplierPriceUpdate):
+    updates = payload.model_dump(exclude={"version"}, exclude_unset=True, exclude_none=True)
     if not updates:
         raise HTTPException(status_code=400, detail="Güncellenecek alan yok")
 
     try:
-        res = (
-            supabase
+        # version eşleşmezse satır güncellenmez; version'ı DB trigger'ı artırır
+        res = await (
+            app.state.supabase
             .table("supplier_prices")
             .update(updates)
-            .eq("id", str(price_id))
+            .eq("id", price_id)
+            .eq("version", payload.version)
             .execute()
         )
         if not res.data:
-            raise HTTPException(status_code=404, detail="Kayıt bulunamadı")
+            exists = await (
+                app.state.supabase
+                .table("supplier_prices")
+                .select("version")
+                .eq("id", price_id)
+                .limit(1)
+                .execute()
+            )
+            if not exists.data:
+                raise HTTPException(status_code=404, detail="Kayıt bulunamadı")
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "Kayıt başka bir istekle güncellendi",
+                    "current_version": exists.data[0]["version"]
+                }
+            )
         return {"message": "updated", "item": res.data[0]}
     except HTTPException:
         raise
@@ -421,13 +690,13 @@ def update_supplier_price(price_id: UUID, payload: SupplierPriceUpdate):
 
 
 @app.patch("/supplier/prices/{price_id}/deactivate")
-def deactivate_supplier_price(price_id: UUID):
+async def deactivate_supplier_price(price_id: UUIDStr):
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("supplier_prices")
             .update({"is_active": False})
-            .eq("id", str(price_id))
+            .eq("id", price_id)
             .execute()
         )
         if not res.data:
@@ -443,105 +712,35 @@ def deactivate_supplier_price(price_id: UUID):
 # 29) CART / DRAFT ORDER
 # -------------------------
 @app.post("/cart/add")
-def add_to_cart(payload: CartAddItem):
+async def add_to_cart(payload: CartAddItem):
     try:
         if payload.quantity <= 0:
             raise HTTPException(status_code=400, detail="quantity > 0 olmalı")
 
-        # 1) clinic için draft order bul / yoksa oluştur
-        order_res = (
-            supabase
-            .table("orders")
-            .select("id")
-            .eq("clinic_user_id", str(payload.clinic_user_id))
-            .eq("status", "draft")
-            .limit(1)
-            .execute()
-        )
-
-        if order_res.data:
-            order_id = order_res.data[0]["id"]
-        else:
-            new_order = (
-                supabase
-                .table("orders")
-                .insert({
-                    "clinic_user_id": str(payload.clinic_user_id),
-                    "status": "draft",
-                    "total_amount": 0
-                })
-                .execute()
-            )
-            order_id = new_order.data[0]["id"]
-
-        # 2) supplier_prices'tan bu ürün+supplier fiyatını çek
-        sp = (
-            supabase
-            .table("supplier_prices")
-            .select("price, stock, is_active")
-            .eq("product_id", str(payload.product_id))
-            .eq("supplier_id", str(payload.supplier_id))
-            .eq("is_active", True)
-            .single()
+        # draft order + fiyat + kalem upsert + toplam: tek RPC (bkz. supabase/migrations)
+        res = await (
+            app.state.supabase
+            .rpc("cart_add", {
+                "p_clinic": payload.clinic_user_id,
+                "p_product": payload.product_id,
+                "p_supplier": payload.supplier_id,
+                "p_qty": payload.quantity
+            })
             .execute()
         )
+        result = res.data or {}
 
-        if not sp.data:
+        if result.get("error") == "offer_not_found":
             raise HTTPException(status_code=404, detail="Bu ürün+tedarikçi için aktif supplier_prices bulunamadı")
 
-        if (sp.data.get("stock") is not None) and sp.data["stock"] <= 0:
+        if result.get("error") == "out_of_stock":
             raise HTTPException(status_code=400, detail="Stok yok (stock <= 0)")
 
-        unit_price = sp.data["price"]
-
-        # 3) Sepette aynı product_id + supplier_id var mı? (varsa qty artır)
-        item_res = (
-            supabase
-            .table("order_items")
-            .select("id, quantity")
-            .eq("order_id", order_id)
-            .eq("product_id", str(payload.product_id))
-            .eq("supplier_id", str(payload.supplier_id))
-            .limit(1)
-            .execute()
-        )
-
-        if item_res.data:
-            item = item_res.data[0]
-            updated = (
-                supabase
-                .table("order_items")
-                .update({"quantity": item["quantity"] + payload.quantity})
-                .eq("id", item["id"])
-                .execute()
-            )
-            total = _recalc_and_update_order_total(order_id)
-            return {
-                "message": "cart_item_updated",
-                "order_id": order_id,
-                "total_amount": total,
-                "item": updated.data[0] if updated.data else None
-            }
-
-        inserted = (
-            supabase
-            .table("order_items")
-            .insert({
-                "order_id": order_id,
-                "product_id": str(payload.product_id),
-                "supplier_id": str(payload.supplier_id),
-                "quantity": payload.quantity,
-                "unit_price": unit_price
-            })
-            .execute()
-        )
-
-        total = _recalc_and_update_order_total(order_id)
         return {
-            "message": "added_to_cart",
-            "order_id": order_id,
-            "total_amount": total,
-            "item": inserted.data[0] if inserted.data else None
+            "message": result.get("message"),
+            "order_id": result.get("order_id"),
+            "total_amount": result.get("total_amount"),
+            "item": result.get("item")
         }
 
     except HTTPException:
@@ -550,14 +749,15 @@ def add_to_cart(payload: CartAddItem):
         raise HTTPException(status_code=500, detail=f"cart/add error: {str(e)}")
 
 
-@app.get("/cart/{clinic_user_id}")
-def get_cart(clinic_user_id: UUID):
+@app.get("/cart/{clinic_user_id}", response_model=CartOut)
+async def get_cart(clinic_user_id: UUIDStr):
     try:
-        order_res = (
-            supabase
+        # order + kalemleri tek select (PostgREST embedded resource)
+        order_res = await (
+            app.state.supabase
             .table("orders")
-            .select("id, total_amount")
-            .eq("clinic_user_id", str(clinic_user_id))
+            .select(CART_SELECT)
+            .eq("clinic_user_id", clinic_user_id)
             .eq("status", "draft")
             .limit(1)
             .execute()
@@ -566,34 +766,13 @@ def get_cart(clinic_user_id: UUID):
         if not order_res.data:
             return {"items": [], "total_amount": 0}
 
-        order_id = order_res.data[0]["id"]
-        total_amount = order_res.data[0].get("total_amount") or 0
-
-        items_res = (
-            supabase
-            .table("order_items")
-            .select("""
-                id,
-                quantity,
-                unit_price,
-                supplier_id,
-                product_id,
-                products (
-                    id,
-                    name
-                ),
-                suppliers (
-                    id,
-                    name
-                )
-            """)
-            .eq("order_id", order_id)
-            .execute()
-        )
+        order = order_res.data[0]
+        order_id = order["id"]
+        total_amount = order.get("total_amount") or 0
 
         return {
             "order_id": order_id,
-            "items": items_res.data or [],
+            "items": order.get("order_items") or [],
             "total_amount": total_amount
         }
 
@@ -602,50 +781,28 @@ def get_cart(clinic_user_id: UUID):
 
 
 @app.post("/orders")
-def create_order(payload: OrderCreateRequest):
+async def create_order(payload: OrderCreateRequest):
     try:
-        draft_res = (
-            supabase
-            .table("orders")
-            .select("id, status, total_amount")
-            .eq("clinic_user_id", str(payload.clinic_user_id))
-            .eq("status", "draft")
-            .limit(1)
+        # kilitle + toplamı hesapla + submitted: tek RPC (bkz. supabase/migrations)
+        res = await (
+            app.state.supabase
+            .rpc("submit_order", {"p_clinic": payload.clinic_user_id})
             .execute()
         )
+        result = res.data or {}
 
-        if not draft_res.data:
+        if result.get("error") == "no_draft":
             raise HTTPException(status_code=404, detail="Draft sepet bulunamadı. Önce /cart/add ile ürün ekle.")
 
-        order_id = draft_res.data[0]["id"]
-
-        items_res = (
-            supabase
-            .table("order_items")
-            .select("id, product_id, supplier_id, quantity, unit_price")
-            .eq("order_id", order_id)
-            .execute()
-        )
-        items = items_res.data or []
-        if len(items) == 0:
+        if result.get("error") == "empty_cart":
             raise HTTPException(status_code=400, detail="Sepet boş. Sipariş oluşturulamaz.")
 
-        total_amount = _recalc_and_update_order_total(order_id)
-
-        updated = (
-            supabase
-            .table("orders")
-            .update({"status": "submitted", "total_amount": total_amount})
-            .eq("id", order_id)
-            .execute()
-        )
-
         return {
             "message": "order_created",
-            "order_id": order_id,
+            "order_id": result.get("order_id"),
             "status": "submitted",
-            "total_amount": total_amount,
-            "items_count": len(items)
+            "total_amount": result.get("total_amount"),
+            "items_count": result.get("items_count")
         }
 
     except HTTPException:
@@ -655,80 +812,57 @@ def create_order(payload: OrderCreateRequest):
 
 
 @app.post("/orders/submit")
-def submit_order(payload: dict):
-    clinic_user_id = payload.get("clinic_user_id")
-
-    if not clinic_user_id:
-        raise HTTPException(status_code=400, detail="clinic_user_id gerekli")
-
-    order_res = (
-        supabase
-        .table("orders")
-        .select("id")
-        .eq("clinic_user_id", clinic_user_id)
-        .eq("status", "draft")
-        .limit(1)
-        .execute()
-    )
+async def submit_order(payload: OrderCreateRequest):
+    # draft -> submitted tek UPDATE; güncellenen satır return=representation ile döner
+    try:
+        res = await (
+            app.state.supabase
+            .table("orders")
+            .update({"status": "submitted"})
+            .eq("clinic_user_id", payload.clinic_user_id)
+            .eq("status", "draft")
+            .execute()
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"orders/submit error: {str(e)}")
 
-    if not order_res.data:
+    if not res.data:
         raise HTTPException(status_code=404, detail="Draft order bulunamadı")
 
-    order_id = order_res.data[0]["id"]
-
-    supabase.table("orders").update({
-        "status": "submitted"
-    }).eq("id", order_id).execute()
-
     return {
         "message": "order_created",
-        "order_id": order_id
+        "order_id": res.data[0]["id"]
     }
 
 
-@app.get("/orders/{clinic_user_id}")
-def get_orders(clinic_user_id: UUID):
+@app.get("/orders/{clinic_user_id}", response_model=ClinicOrdersOut)
+async def get_orders(clinic_user_id: UUIDStr):
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("orders")
             .select("id, status, total_amount, created_at")
-            .eq("clinic_user_id", str(clinic_user_id))
+            .eq("clinic_user_id", clinic_user_id)
             .order("created_at", desc=True)
             .execute()
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return {"clinic_user_id": str(clinic_user_id), "orders": res.data or []}
+    return {"clinic_user_id": clinic_user_id, "orders": res.data or []}
 
 
-@app.get("/supplier/my-prices/{supplier_id}")
-def supplier_my_prices(supplier_id: UUID):
+@app.get("/supplier/my-prices/{supplier_id}", response_model=SupplierPricesOut)
+async def supplier_my_prices(supplier_id: UUIDStr):
     try:
-        res = (
-            supabase
+        res = await (
+            app.state.supabase
             .table("supplier_prices")
-            .select("""
-                id,
-                price,
-                stock,
-                delivery_days,
-                is_active,
-                created_at,
-                product_id,
-                supplier_id,
-                products (
-                    id,
-                    name,
-                    unit,
-                    brand
-                )
-            """)
-            .eq("supplier_id", str(supplier_id))
+            .select(SUPPLIER_PRICES_SELECT)
+            .eq("supplier_id", supplier_id)
             .order("created_at", desc=True)
             .execute()
         )
-        return {"supplier_id": str(supplier_id), "items": res.data or []}
+        return {"supplier_id": supplier_id, "items": res.data or []}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,156 @@
+-- /cart/add: draft order bul/oluştur + fiyat çek + kalemi upsert et + toplamı
+-- yeniden hesapla. Hepsi tek transaction, tek PostgREST roundtrip.
+
+-- Eski read-then-insert /cart/add yarışından kalmış olabilecek tekrarları temizle;
+-- aksi halde aşağıdaki unique index'ler oluşturulamaz.
+
+-- 1) clinic başına birden çok draft: en eskisinde topla, kalemleri ona taşı
+with ranked as (
+    select o.id,
+           first_value(o.id) over (
+               partition by o.clinic_user_id
+               order by o.created_at, o.id
+           ) as keep_id
+      from public.orders o
+     where o.status = 'draft'
+)
+update public.order_items i
+   set order_id = r.keep_id
+  from ranked r
+ where i.order_id = r.id
+   and r.id <> r.keep_id;
+
+with ranked as (
+    select o.id,
+           first_value(o.id) over (
+               partition by o.clinic_user_id
+               order by o.created_at, o.id
+           ) as keep_id
+      from public.orders o
+     where o.status = 'draft'
+)
+delete from public.orders o
+ using ranked r
+ where o.id = r.id
+   and r.id <> r.keep_id;
+
+-- 2) aynı (order, product, supplier) kalemleri: quantity'leri tek satırda topla
+with ranked as (
+    select i.id,
+           first_value(i.id) over w as keep_id,
+           sum(i.quantity) over w as total_qty
+      from public.order_items i
+    window w as (
+        partition by i.order_id, i.product_id, i.supplier_id
+        order by i.id
+        rows between unbounded preceding and unbounded following
+    )
+)
+update public.order_items i
+   set quantity = r.total_qty
+  from ranked r
+ where i.id = r.id
+   and r.id = r.keep_id
+   and i.quantity <> r.total_qty;
+
+with ranked as (
+    select i.id,
+           first_value(i.id) over (
+               partition by i.order_id, i.product_id, i.supplier_id
+               order by i.id
+           ) as keep_id
+      from public.order_items i
+)
+delete from public.order_items i
+ using ranked r
+ where i.id = r.id
+   and r.id <> r.keep_id;
+
+-- 3) birleştirilen draft'ların toplamlarını yeniden hesapla
+update public.orders o
+   set total_amount = coalesce((
+           select sum(i.quantity * i.unit_price)
+             from public.order_items i
+            where i.order_id = o.id
+       ), 0)
+ where o.status = 'draft';
+
+-- Her clinic için en fazla bir draft order (ON CONFLICT hedefi)
+create unique index if not exists orders_draft_idx
+    on public.orders (clinic_user_id)
+    where status = 'draft';
+
+-- Sepette aynı ürün+tedarikçi tek satır (ON CONFLICT hedefi)
+create unique index if not exists order_items_natural_key
+    on public.order_items (order_id, product_id, supplier_id);
+
+create or replace function public.cart_add(
+    p_clinic uuid,
+    p_product uuid,
+    p_supplier uuid,
+    p_qty int
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_price numeric;
+    v_stock int;
+    v_order_id uuid;
+    v_item jsonb;
+    v_inserted boolean;
+    v_total numeric;
+begin
+    select sp.price, sp.stock
+      into v_price, v_stock
+      from public.supplier_prices sp
+     where sp.product_id = p_product
+       and sp.supplier_id = p_supplier
+       and sp.is_active
+     limit 1
+       for share;
+
+    if not found then
+        return jsonb_build_object('error', 'offer_not_found');
+    end if;
+
+    if v_stock is not null and v_stock <= 0 then
+        return jsonb_build_object('error', 'out_of_stock');
+    end if;
+
+    insert into public.orders (clinic_user_id, status, total_amount)
+    values (p_clinic, 'draft', 0)
+    on conflict (clinic_user_id) where status = 'draft' do nothing;
+
+    select o.id
+      into v_order_id
+      from public.orders o
+     where o.clinic_user_id = p_clinic
+       and o.status = 'draft'
+       for update;
+
+    -- xmax = 0 -> yeni satır eklendi, aksi halde mevcut kalemin qty'si arttı
+    insert into public.order_items as oi (order_id, product_id, supplier_id, quantity, unit_price)
+    values (v_order_id, p_product, p_supplier, p_qty, v_price)
+    on conflict (order_id, product_id, supplier_id)
+    do update set quantity = oi.quantity + excluded.quantity
+    returning to_jsonb(oi.*), (oi.xmax = 0)
+      into v_item, v_inserted;
+
+    update public.orders o
+       set total_amount = coalesce((
+               select sum(i.quantity * i.unit_price)
+                 from public.order_items i
+                where i.order_id = v_order_id
+           ), 0)
+     where o.id = v_order_id
+    returning o.total_amount into v_total;
+
+    return jsonb_build_object(
+        'message', case when v_inserted then 'added_to_cart' else 'cart_item_updated' end,
+        'order_id', v_order_id,
+        'total_amount', v_total,
+        'item', v_item
+    );
+end;
+$$;
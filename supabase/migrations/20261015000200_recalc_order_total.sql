@@ -0,0 +1,14 @@
+-- Sipariş toplamını sunucu tarafında hesapla ve yaz: tek UPDATE, tek roundtrip.
+create or replace function public.recalc_order_total(p_order_id uuid)
+returns numeric
+language sql
+as $$
+    update public.orders o
+       set total_amount = coalesce((
+               select sum(i.quantity * i.unit_price)
+                 from public.order_items i
+                where i.order_id = p_order_id
+           ), 0)
+     where o.id = p_order_id
+    returning o.total_amount;
+$$;
@@ -0,0 +1,13 @@
+-- /products/search: name/brand/description üzerinde GIN indeksli full-text search
+alter table public.products
+    add column if not exists search_tsv tsvector
+    generated always as (
+        to_tsvector(
+            'simple',
+            coalesce(name, '') || ' ' || coalesce(brand, '') || ' ' || coalesce(description, '')
+        )
+    ) stored;
+
+create index if not exists products_search_gin
+    on public.products
+    using gin (search_tsv);
@@ -0,0 +1,37 @@
+-- /brands ve /units: distinct değerler sunucuda hazır, sıralı
+create materialized view if not exists public.product_brands as
+    select distinct brand
+      from public.products
+     where brand is not null and brand <> ''
+     order by brand;
+
+create materialized view if not exists public.product_units as
+    select distinct unit
+      from public.products
+     where unit is not null and unit <> ''
+     order by unit;
+
+-- refresh ... concurrently için unique index gerekli
+create unique index if not exists product_brands_brand_idx on public.product_brands (brand);
+create unique index if not exists product_units_unit_idx on public.product_units (unit);
+
+grant select on public.product_brands, public.product_units to anon, authenticated;
+
+create or replace function public.refresh_product_brands_units()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    refresh materialized view concurrently public.product_brands;
+    refresh materialized view concurrently public.product_units;
+    return null;
+end;
+$$;
+
+drop trigger if exists products_refresh_brands_units on public.products;
+create trigger products_refresh_brands_units
+    after insert or update of brand, unit or delete or truncate on public.products
+    for each statement
+    execute function public.refresh_product_brands_units();
@@ -0,0 +1,24 @@
+-- /products/offers: birden çok ürün için en iyi teklif, tek sorgu (DISTINCT ON)
+create or replace function public.best_offers_bulk(p_ids uuid[])
+returns setof jsonb
+language sql
+stable
+as $$
+    select distinct on (sp.product_id)
+           jsonb_build_object(
+               'product_id', sp.product_id,
+               'id', sp.id,
+               'price', sp.price,
+               'stock', sp.stock,
+               'delivery_days', sp.delivery_days,
+               'supplier_id', sp.supplier_id,
+               'suppliers', case when s.id is null then null
+                                 else jsonb_build_object('id', s.id, 'name', s.name) end
+           )
+      from public.supplier_prices sp
+      left join public.suppliers s on s.id = sp.supplier_id
+     where sp.product_id = any(p_ids)
+       and sp.is_active
+       and sp.stock > 0
+     order by sp.product_id, sp.price, sp.delivery_days;
+$$;
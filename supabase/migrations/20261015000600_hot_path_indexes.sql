@@ -0,0 +1,25 @@
+-- main.py'deki sık WHERE/ORDER BY kalıplarına birebir uyan indeksler.
+-- (orders_draft_idx ve order_items_natural_key cart_add migration'ında eklendi.)
+
+-- /products/{id}/offers, /products/{id}/best-offer, best_offers_bulk:
+-- product_id = ? AND is_active AND stock > 0 ORDER BY price, delivery_days
+create index if not exists supplier_prices_active_idx
+    on public.supplier_prices (product_id, price, delivery_days)
+    where is_active and stock > 0;
+
+-- cart_add: product_id = ? AND supplier_id = ? AND is_active
+create index if not exists supplier_prices_product_supplier_idx
+    on public.supplier_prices (product_id, supplier_id)
+    where is_active;
+
+-- /supplier/my-prices/{supplier_id}: supplier_id = ? ORDER BY created_at DESC
+create index if not exists supplier_prices_supplier_created_idx
+    on public.supplier_prices (supplier_id, created_at desc);
+
+-- /orders/{clinic_user_id}: clinic_user_id = ? ORDER BY created_at DESC
+create index if not exists orders_clinic_created_idx
+    on public.orders (clinic_user_id, created_at desc);
+
+-- /products/search keyset: ORDER BY name, id + (name, id) > cursor
+create index if not exists products_name_id_idx
+    on public.products (name, id);
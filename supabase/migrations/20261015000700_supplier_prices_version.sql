@@ -0,0 +1,20 @@
+-- supplier_prices için optimistic concurrency: her UPDATE version'ı bir artırır,
+-- PUT /supplier/prices/{id} yalnızca istemcinin gördüğü version hâlâ güncelse yazar.
+alter table public.supplier_prices
+    add column if not exists version int not null default 1;
+
+create or replace function public.bump_supplier_prices_version()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.version := old.version + 1;
+    return new;
+end;
+$$;
+
+drop trigger if exists supplier_prices_bump_version on public.supplier_prices;
+create trigger supplier_prices_bump_version
+    before update on public.supplier_prices
+    for each row
+    execute function public.bump_supplier_prices_version();
@@ -0,0 +1,41 @@
+-- Access token'a profiles.role'ü "user_role" claim'i olarak göm: /login ve frontend
+-- rolü token'dan okur, ayrıca profiles sorgusu gerekmez. ("role" claim'i Postgres
+-- rolüdür (authenticated), o yüzden ayrı isim.)
+-- Etkinleştirmek için: Dashboard > Authentication > Hooks > Custom Access Token
+-- (ya da config.toml: [auth.hook.custom_access_token]).
+create or replace function public.custom_access_token_hook(event jsonb)
+returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    claims jsonb;
+    v_role text;
+begin
+    select p.role
+      into v_role
+      from public.profiles p
+     where p.user_id = (event->>'user_id')::uuid;
+
+    claims := event->'claims';
+    if v_role is not null then
+        claims := jsonb_set(claims, '{user_role}', to_jsonb(v_role));
+    end if;
+
+    return jsonb_set(event, '{claims}', claims);
+end;
+$$;
+
+grant usage on schema public to supabase_auth_admin;
+grant execute on function public.custom_access_token_hook to supabase_auth_admin;
+revoke execute on function public.custom_access_token_hook from authenticated, anon, public;
+
+grant select on table public.profiles to supabase_auth_admin;
+
+drop policy if exists "auth admin can read profiles" on public.profiles;
+create policy "auth admin can read profiles"
+    on public.profiles
+    as permissive
+    for select
+    to supabase_auth_admin
+    using (true);
@@ -0,0 +1,51 @@
+-- POST /orders: draft'ı kilitle, toplamı sunucuda hesapla ve status'u tek UPDATE'te
+-- submitted yap. Status submitted olup total'ın eski kaldığı bir an yok.
+create or replace function public.submit_order(p_clinic uuid)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_order_id uuid;
+    v_items_count bigint;
+    v_total numeric;
+begin
+    select o.id
+      into v_order_id
+      from public.orders o
+     where o.clinic_user_id = p_clinic
+       and o.status = 'draft'
+       for update;
+
+    if not found then
+        return jsonb_build_object('error', 'no_draft');
+    end if;
+
+    select count(*)
+      into v_items_count
+      from public.order_items i
+     where i.order_id = v_order_id;
+
+    if v_items_count = 0 then
+        return jsonb_build_object('error', 'empty_cart');
+    end if;
+
+    update public.orders o
+       set status = 'submitted',
+           total_amount = coalesce((
+               select sum(i.quantity * i.unit_price)
+                 from public.order_items i
+                where i.order_id = o.id
+           ), 0)
+     where o.id = v_order_id
+    returning o.total_amount into v_total;
+
+    return jsonb_build_object(
+        'order_id', v_order_id,
+        'total_amount', v_total,
+        'items_count', v_items_count
+    );
+end;
+$$;
+
+-- recalc_order_total'ın son çağıranı (POST /orders) artık submit_order kullanıyor
+drop function if exists public.recalc_order_total(uuid);